@@ -537,7 +537,8 @@ class ActivityPub(User, Protocol):
             error('No HTTP Signature', status=401)
 
         logger.debug('Verifying HTTP Signature')
-        logger.debug(f'Headers: {json_dumps(headers, indent=2)}')
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f'Headers: {json_dumps(headers, indent=2)}')
 
         # parse_signature_header lower-cases all keys
         sig_fields = parse_signature_header(sig)
@@ -680,7 +681,8 @@ def signed_request(fn, url, data=None, headers=None, from_user=None,
         from_user = instance_actor()
 
     if data:
-        logger.debug(f'Sending AS2 object: {json_dumps(data, indent=2)}')
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f'Sending AS2 object: {json_dumps(data, indent=2)}')
         data = json_dumps(data).encode()
 
     headers = {
@@ -1096,7 +1098,8 @@ def actor(handle_or_id):
         },
     })
 
-    logger.debug(f'Returning: {json_dumps(actor, indent=2)}')
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(f'Returning: {json_dumps(actor, indent=2)}')
     return actor, {
         'Content-Type': as2_type,
         'Access-Control-Allow-Origin': '*',
@@ -1258,7 +1261,8 @@ def follower_collection(id, collection):
             '@context': 'https://www.w3.org/ns/activitystreams',
             'id': request.url,
         })
-        logger.debug(f'Returning {json_dumps(page, indent=2)}')
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f'Returning {json_dumps(page, indent=2)}')
         return page, {'Content-Type': as2.CONTENT_TYPE_LD_PROFILE}
 
     ret = {
@@ -1277,7 +1281,8 @@ def follower_collection(id, collection):
     if count != 1001:
         ret['totalItems'] = count
 
-    logger.debug(f'Returning {json_dumps(collection, indent=2)}')
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(f'Returning {json_dumps(collection, indent=2)}')
     return ret, {
         'Content-Type': as2.CONTENT_TYPE_LD_PROFILE,
     }
@@ -6,7 +6,6 @@ from datetime import timedelta
 import itertools
 import logging
 import os
-import re
 
 from arroba import did
 from arroba.did import get_handle
@@ -54,8 +53,6 @@ from werkzeug.exceptions import NotFound
 
 import common
 from common import (
-    DOMAIN_BLOCKLIST,
-    DOMAIN_RE,
     DOMAINS,
     error,
     PRIMARY_DOMAIN,
@@ -280,7 +277,7 @@ class ATProto(User, Protocol):
             assert id.removeprefix('did:plc:')
         elif id.startswith('did:web:'):
             domain = id.removeprefix('did:web:')
-            assert (re.match(common.DOMAIN_RE, domain)
+            assert (common.DOMAIN_PATTERN.match(domain)
                     and not Protocol.is_blocklisted(domain)), domain
         else:
             assert False, f'{id} is not valid did:plc or did:web'
@@ -407,7 +404,8 @@ class ATProto(User, Protocol):
     def is_blocklisted(url, allow_internal=False):
         # don't block common.DOMAINS since we want ourselves, ie our own PDS, to
         # be a valid domain to send to
-        return util.domain_or_parent_in(util.domain_from_link(url), DOMAIN_BLOCKLIST)
+        return common.domain_or_parent_in_set(util.domain_from_link(url),
+                                              common.DOMAIN_BLOCKLIST_SET)
 
     @classmethod
     def create_for(cls, user):
@@ -35,6 +35,7 @@ logger = logging.getLogger(__name__)
 #
 # TODO: preprocess with domain2idna, then narrow this to just [a-z0-9-]
 DOMAIN_RE = r'^([^/:;@?!\'.]+\.)+[^/:@_?!\'.]+$'
+DOMAIN_PATTERN = re.compile(DOMAIN_RE)
 
 CONTENT_TYPE_HTML = 'text/html; charset=utf-8'
 
@@ -80,6 +81,10 @@ DOMAIN_BLOCKLIST = (
     'youtube.com',
 )
 
+# frozensets for domain_or_parent_in_set
+DOMAIN_BLOCKLIST_SET = frozenset(DOMAIN_BLOCKLIST)
+DOMAIN_BLOCKLIST_AND_DOMAINS_SET = frozenset(DOMAIN_BLOCKLIST + DOMAINS)
+
 SMTP_HOST = 'smtp.gmail.com'
 SMTP_PORT = 587
 
@@ -125,6 +130,27 @@ def protocol_user_copy_ids():
     return tuple(ids)
 
 
+def domain_or_parent_in_set(domain, domains):
+    """Returns True if a domain or any of its parent domains is in a set.
+
+    Like :func:`oauth_dropins.webutil.util.domain_or_parent_in`, but does one
+    set lookup per label in ``domain`` instead of scanning ``domains``.
+
+    Args:
+      domain (str)
+      domains (set or frozenset of str)
+
+    Returns:
+      bool:
+    """
+    while domain:
+        if domain in domains:
+            return True
+        _, _, domain = domain.partition('.')
+
+    return False
+
+
 def base64_to_long(x):
     """Converts from URL safe base64 encoding to long integer.
 
@@ -267,7 +293,7 @@ def unwrap(val, field=None):
     elif isinstance(val, str):
         if match := SUBDOMAIN_BASE_URL_RE.match(val):
             unwrapped = match.group('path')
-            if field in ID_FIELDS and re.fullmatch(DOMAIN_RE, unwrapped):
+            if field in ID_FIELDS and DOMAIN_PATTERN.fullmatch(unwrapped):
                 return f'https://{unwrapped}/'
             return unwrapped
 
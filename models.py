@@ -29,7 +29,7 @@ from requests import RequestException
 import common
 from common import (
     base64_to_long,
-    DOMAIN_RE,
+    DOMAIN_PATTERN,
     long_to_base64,
     OLD_ACCOUNT_AGE,
     PROTOCOL_DOMAINS,
@@ -1026,7 +1026,7 @@ class Object(StringIdModel):
         def use_urls_as_ids(obj):
             """If id field is missing or not a URL, use the url field."""
             id = obj.get('id')
-            if not id or not (util.is_web(id) or re.match(DOMAIN_RE, id)):
+            if not id or not (util.is_web(id) or DOMAIN_PATTERN.match(id)):
                 if url := util.get_url(obj):
                     obj['id'] = url
 
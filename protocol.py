@@ -25,7 +25,6 @@ from werkzeug.exceptions import BadGateway, HTTPException
 
 import common
 from common import (
-    DOMAIN_BLOCKLIST,
     DOMAIN_RE,
     DOMAINS,
     PRIMARY_DOMAIN,
@@ -737,10 +736,10 @@ class Protocol:
           allow_internal (bool): whether to return False for internal domains
             like ``fed.brid.gy``, ``bsky.brid.gy``, etc
         """
-        blocklist = DOMAIN_BLOCKLIST
-        if not allow_internal:
-            blocklist += DOMAINS
-        return util.domain_or_parent_in(util.domain_from_link(url), blocklist)
+        blocklist = (common.DOMAIN_BLOCKLIST_SET if allow_internal
+                     else common.DOMAIN_BLOCKLIST_AND_DOMAINS_SET)
+        return common.domain_or_parent_in_set(util.domain_from_link(url),
+                                              blocklist)
 
     @classmethod
     def translate_ids(to_cls, obj):
@@ -1327,7 +1326,8 @@ class Protocol:
                     **obj_as1,
                 },
             }
-            logger.debug(f'  AS1: {json_dumps(update_as1, indent=2)}')
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(f'  AS1: {json_dumps(update_as1, indent=2)}')
             return Object(id=id, our_as1=update_as1,
                           source_protocol=obj.source_protocol)
 
@@ -1344,7 +1344,8 @@ class Protocol:
                 'published': now,
             }
             logger.info(f'Wrapping in post')
-            logger.debug(f'  AS1: {json_dumps(create_as1, indent=2)}')
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(f'  AS1: {json_dumps(create_as1, indent=2)}')
             return Object(id=create_id, our_as1=create_as1,
                           source_protocol=obj.source_protocol)
 
@@ -1426,15 +1427,17 @@ class Protocol:
         write_obj = crud_obj or obj
         write_obj.dirty = False
 
-        target_uris = sorted(set(as1.targets(obj.as1)))
+        obj_as1 = obj.as1
+        target_uris = sorted(set(as1.targets(obj_as1)))
         logger.info(f'Raw targets: {target_uris}')
         orig_obj = None
         targets = {}  # maps Target to Object or None
-        owner = as1.get_owner(obj.as1)
+        owner = as1.get_owner(obj_as1)
         allow_opt_out = (obj.type == 'delete')
-        inner_obj_as1 = as1.get_object(obj.as1)
+        inner_obj_as1 = as1.get_object(obj_as1)
         inner_obj_id = inner_obj_as1.get('id')
         in_reply_tos = as1.get_ids(inner_obj_as1, 'inReplyTo')
+        object_ids = as1.get_ids(obj_as1, 'object')
         is_reply = obj.type == 'comment' or in_reply_tos
         is_self_reply = False
 
@@ -1524,7 +1527,7 @@ Hi! You <a href="{inner_obj_as1.get('url') or inner_obj_id}">recently replied</a
             # only use orig_obj for inReplyTos, like/repost objects, etc
             # https://github.com/snarfed/bridgy-fed/issues/1237
             targets[Target(protocol=target_proto.LABEL, uri=target)] = (
-                orig_obj if id in in_reply_tos or id in as1.get_ids(obj.as1, 'object')
+                orig_obj if id in in_reply_tos or id in object_ids
                 else None)
 
             if target_author_key:
@@ -1581,7 +1584,12 @@ Hi! You <a href="{inner_obj_as1.get('url') or inner_obj_id}">recently replied</a
                     if write_obj.feed:
                         write_obj.dirty = True
 
-            # collect targets for followers
+            # collect targets for followers. many followers often share an
+            # inbox, eg an instance's shared inbox; targets is keyed by URI, so
+            # those collapse into a single delivery. for shares, load the
+            # original object once up front, not once per follower.
+            shared_obj = (Object.get_by_id(inner_obj_id)
+                          if obj.type == 'share' and users else None)
             for user in users:
                 # TODO: should we pass remote=False through here to Protocol.load?
                 target = user.target_for(user.obj, shared=True) if user.obj else None
@@ -1595,8 +1603,7 @@ Hi! You <a href="{inner_obj_as1.get('url') or inner_obj_id}">recently replied</a
                 # https://atproto.com/specs/did#did-documents
                 target = util.dedupe_urls([target], trailing_slash=False)[0]
 
-                targets[Target(protocol=user.LABEL, uri=target)] = \
-                    Object.get_by_id(inner_obj_id) if obj.type == 'share' else None
+                targets[Target(protocol=user.LABEL, uri=target)] = shared_obj
 
         # deliver to enabled HAS_COPIES protocols proactively
         # TODO: abstract for other protocols
@@ -1614,7 +1621,7 @@ Hi! You <a href="{inner_obj_as1.get('url') or inner_obj_id}">recently replied</a
         targets = {}
         source_domains = [
             util.domain_from_link(url) for url in
-            (obj.as1.get('id'), obj.as1.get('url'), as1.get_owner(obj.as1))
+            (obj_as1.get('id'), obj_as1.get('url'), owner)
             if util.is_web(url)
         ]
         for url in sorted(util.dedupe_urls(
@@ -1865,7 +1872,8 @@ def send_task():
         delay_s = int((util.now().replace(tzinfo=None) - obj.created).total_seconds())
         delay = f'({delay_s} s behind)'
     logger.info(f'Sending {obj.source_protocol} {obj.type} {obj.key.id()} to {protocol} {url} {delay}')
-    logger.debug(f'  AS1: {json_dumps(obj.as1, indent=2)}')
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(f'  AS1: {json_dumps(obj.as1, indent=2)}')
     sent = None
     try:
         sent = PROTOCOLS[protocol].send(obj, url, from_user=user,
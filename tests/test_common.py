@@ -40,6 +40,15 @@ class CommonTest(TestCase):
 <span class="logo" title="Web">🌐</span> <a class="h-card u-author" rel="me" href="https://user.com/" title="user.com"><span style="unicode-bidi: isolate">user.com</span></a>""", common.pretty_link('https://user.com/', user=Web(id='user.com')),
         ignore_blanks=True)
 
+    def test_domain_or_parent_in_set(self):
+        domains = frozenset(('x.com', 'y.z'))
+        for domain in 'x.com', 'a.x.com', 'a.b.x.com', 'y.z', 'a.y.z':
+            self.assertTrue(common.domain_or_parent_in_set(domain, domains), domain)
+
+        for domain in None, '', 'com', 'z', 'ax.com', 'x.com.a', 'y.zz':
+            self.assertFalse(common.domain_or_parent_in_set(domain, domains),
+                             domain)
+
     def test_redirect_wrap_empty(self):
         self.assertIsNone(common.redirect_wrap(None))
         self.assertEqual('', common.redirect_wrap(''))
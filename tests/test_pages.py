@@ -219,14 +219,13 @@ class PagesTest(TestCase):
         self.assert_equals(200, got.status_code)
 
     def test_user_object_url_object(self):
-        with self.request_context:
-            Object(id='a', users=[self.user.key], our_as1={
-                **REPOST_AS2,
-                'object': {
-                    'id': 'https://mas.to/toot/id',
-                    'url': {'value': 'http://foo', 'displayName': 'bar'},
-                },
-            }).put()
+        Object(id='a', users=[self.user.key], our_as1={
+            **REPOST_AS2,
+            'object': {
+                'id': 'https://mas.to/toot/id',
+                'url': {'value': 'http://foo', 'displayName': 'bar'},
+            },
+        }).put()
 
         got = self.client.get('/web/user.com')
         self.assert_equals(200, got.status_code)
@@ -1,19 +1,16 @@
 """Unit tests for webmention.py."""
 import copy
 from datetime import timedelta
-from unittest.mock import ANY, patch
+from unittest.mock import patch
 
 import arroba.server
 from arroba.util import at_uri
 from flask import get_flashed_messages
 from google.cloud import ndb
-from granary import as1, as2, atom, microformats2, rss
-from granary.source import html_to_text
+from granary import as2, atom, microformats2, rss
 from oauth_dropins.webutil import util
-from oauth_dropins.webutil import appengine_info
-from oauth_dropins.webutil.flask_util import NoContent
 from oauth_dropins.webutil.testutil import NOW, NOW_SECONDS, requests_response
-from oauth_dropins.webutil.util import json_dumps, json_loads
+from oauth_dropins.webutil.util import json_loads
 import requests
 from werkzeug.exceptions import BadGateway, BadRequest
 
@@ -23,7 +20,7 @@ from . import testutil
 from activitypub import ActivityPub
 from atproto import ATProto
 import common
-from common import CONTENT_TYPE_HTML, TASKS_LOCATION
+from common import CONTENT_TYPE_HTML
 from flask_app import app
 import ids
 from models import Follower, Object, Target
@@ -158,6 +155,7 @@ REPOST_HCITE_HTML = """\
 </html>
 """
 REPOST_HCITE = requests_response(REPOST_HTML, url='https://user.com/repost')
+REPOST_HCITE_MF2 = util.parse_mf2(REPOST_HCITE_HTML)['items'][0]
 
 WEBMENTION_REL_LINK = requests_response(
     '<html><head><link rel="webmention" href="/webmention"></html>')
@@ -226,7 +224,6 @@ CREATE_REPLY_AS1 = {
     'object': REPLY_AS1,
     'published': '2022-01-02T03:04:05+00:00',
 }
-REPLY_AS2 = as2.from_as1(REPLY_AS1)
 
 LIKE_HTML = """\
 <html>
@@ -248,6 +245,10 @@ ACTOR = TestCase.as2_resp({
     'image': 'http://pic',
 })
 
+AS2_REPLY_CONTENT = """\
+<p><a class="u-in-reply-to" href="http://no.tt/fediverse"></a>
+<a class="u-in-reply-to" href="https://mas.to/toot">foo ☕ bar</a>
+<a href="http://localhost/"></a></p>"""
 AS2_CREATE = {
     '@context': 'https://www.w3.org/ns/activitystreams',
     'type': 'Create',
@@ -258,15 +259,9 @@ AS2_CREATE = {
         'type': 'Note',
         'id': 'http://localhost/r/https://user.com/reply',
         'name': 'foo ☕ bar',
-        'content': """\
-<p><a class="u-in-reply-to" href="http://no.tt/fediverse"></a>
-<a class="u-in-reply-to" href="https://mas.to/toot">foo ☕ bar</a>
-<a href="http://localhost/"></a></p>""",
+        'content': AS2_REPLY_CONTENT,
         'contentMap': {
-            'en': """\
-<p><a class="u-in-reply-to" href="http://no.tt/fediverse"></a>
-<a class="u-in-reply-to" href="https://mas.to/toot">foo ☕ bar</a>
-<a href="http://localhost/"></a></p>""",
+            'en': AS2_REPLY_CONTENT,
         },
         'inReplyTo': 'https://mas.to/toot/id',
         'to': [as2.PUBLIC_AUDIENCE],
@@ -290,15 +285,17 @@ AS2_CREATE = {
         as2.PUBLIC_AUDIENCE,
     ],
 }
-AS2_UPDATE = copy.deepcopy(AS2_CREATE)
-AS2_UPDATE.update({
+AS2_UPDATE = {
+    **{k: v for k, v in AS2_CREATE.items() if k != 'published'},
     'id': 'http://localhost/r/https://user.com/reply#bridgy-fed-update-2022-01-02T03:04:05+00:00',
     'type': 'Update',
-})
-del AS2_UPDATE['published']
-# we should generate this if it's not already in mf2 because Mastodon
-# requires it for updates
-AS2_UPDATE['object']['updated'] = NOW.isoformat()
+    'object': {
+        **AS2_CREATE['object'],
+        # we should generate this if it's not already in mf2 because Mastodon
+        # requires it for updates
+        'updated': NOW.isoformat(),
+    },
+}
 
 FOLLOW_HTML = """\
 <html>
@@ -386,13 +383,15 @@ CREATE_AS2 = {
     'published': '2022-01-02T03:04:05+00:00',
     'to': [as2.PUBLIC_AUDIENCE],
 }
-UPDATE_AS2 = copy.deepcopy(CREATE_AS2)
-UPDATE_AS2.update({
+UPDATE_AS2 = {
+    **{k: v for k, v in CREATE_AS2.items() if k != 'published'},
     'type': 'Update',
     'id': 'http://localhost/r/https://user.com/post#bridgy-fed-update-2022-01-02T03:04:05+00:00',
-})
-del UPDATE_AS2['published']
-UPDATE_AS2['object']['updated'] = NOW.isoformat()
+    'object': {
+        **CREATE_AS2['object'],
+        'updated': NOW.isoformat(),
+    },
+}
 
 NOT_FEDIVERSE = requests_response("""\
 <html>
@@ -402,13 +401,16 @@ NOT_FEDIVERSE = requests_response("""\
 </body>
 </html>
 """, url='http://no.tt/fediverse')
-ACTIVITYPUB_GETS = [
+ACTIVITYPUB_GETS = (
     REPLY,
     NOT_FEDIVERSE,  # AP
     NOT_FEDIVERSE,  # Web
     TOOT_AS2,       # AP
     ACTOR,
-]
+)
+# delivery targets for the active followers from WebTest.make_followers
+FOLLOWER_INBOXES = ('https://inbox', 'https://public/inbox', 'https://shared/inbox')
+
 def web_user_gets(domain='user.com'):
     return [
         requests_response(ACTOR_HTML, url=f'https://{domain}/'),
@@ -430,7 +432,13 @@ class WebTest(TestCase):
         self.mrs_foo = ndb.Key(ActivityPub, 'https://mas.to/mrs-foo')
 
     def make_followers(self):
+        """Creates ActivityPub users that follow self.user.
+
+        The users are all new, so build the Followers directly and store them
+        in one batch instead of querying for each one via get_or_create.
+        """
         self.followers = []
+        followers = []
 
         for id, kwargs, actor in [
             ('https://mastodon/aaa', {}, None),
@@ -455,10 +463,13 @@ class WebTest(TestCase):
             }),
         ]:
             from_ = self.make_user(id, cls=ActivityPub, obj_as2=actor)
-            f = Follower.get_or_create(to=self.user, from_=from_, **kwargs)
+            f = Follower(to=self.user.key, from_=from_.key, **kwargs)
+            followers.append(f)
             if f.status != 'inactive':
                 self.followers.append(from_.key)
 
+        ndb.put_multi(followers)
+
     def test_put_validates_domain_id(self, *_):
         for bad in (
             'AbC.cOm',
@@ -676,6 +687,7 @@ class WebTest(TestCase):
 
         self.assertEqual(202, got.status_code)
         self.assert_task(mock_create_task, 'webmention', **params)
+        mock_create_task.assert_called_once()
 
         self.assertEqual(NOW, self.user.key.get().last_webmention_in)
 
@@ -916,11 +928,12 @@ class WebTest(TestCase):
 
         https://github.com/snarfed/bridgy-fed/issues/40
         """
-        toot_as2_data = copy.deepcopy(TOOT_AS2_DATA)
-        del toot_as2_data['actor']
-        toot_as2_data['attributedTo'] = {
-            'type': 'Person',
-            'id': 'https://mas.to/author',
+        toot_as2_data = {
+            **{k: v for k, v in TOOT_AS2_DATA.items() if k != 'actor'},
+            'attributedTo': {
+                'type': 'Person',
+                'id': 'https://mas.to/author',
+            },
         }
 
         mock_get.side_effect = [
@@ -951,12 +964,13 @@ class WebTest(TestCase):
         self.assert_equals(AS2_CREATE, json_loads(kwargs['data']))
 
     def test_repost(self, mock_get, mock_post):
-        self._test_repost(REPOST_HTML, REPOST_AS2, mock_get, mock_post)
+        self._test_repost(REPOST_HTML, REPOST_MF2, REPOST_AS2, mock_get, mock_post)
 
     def test_repost_composite_hcite(self, mock_get, mock_post):
-        self._test_repost(REPOST_HCITE_HTML, REPOST_AS2, mock_get, mock_post)
+        self._test_repost(REPOST_HCITE_HTML, REPOST_HCITE_MF2, REPOST_AS2,
+                          mock_get, mock_post)
 
-    def _test_repost(self, html, expected_as2, mock_get, mock_post):
+    def _test_repost(self, html, mf2, expected_as2, mock_get, mock_post):
         self.make_followers()
 
         REPOSTED_ACTOR = self.as2_resp({
@@ -985,8 +999,7 @@ class WebTest(TestCase):
             self.as2_req('https://mas.to/author'),
         ))
 
-        inboxes = ('https://inbox', 'https://public/inbox',
-                   'https://shared/inbox', 'https://mas.to/inbox')
+        inboxes = FOLLOWER_INBOXES + ('https://mas.to/inbox',)
         self.assert_ap_deliveries(mock_post, inboxes, expected_as2, ignore=['cc'])
 
         for args, kwargs in mock_get.call_args_list[1:]:
@@ -994,7 +1007,6 @@ class WebTest(TestCase):
                 rsa_key = kwargs['auth'].header_signer._rsa._key
                 self.assertEqual(self.user.private_pem(), rsa_key.exportKey())
 
-        mf2 = util.parse_mf2(html)['items'][0]
         author_key = ndb.Key('ActivityPub', 'https://mas.to/author')
         self.assert_object('https://user.com/repost',
                            users=[self.user.key],
@@ -1080,7 +1092,7 @@ class WebTest(TestCase):
         })
         self.assertEqual(202, got.status_code)
 
-        inboxes = ['https://inbox', 'https://public/inbox', 'https://shared/inbox']
+        inboxes = FOLLOWER_INBOXES
         self.assert_ap_deliveries(mock_post, inboxes, {
             '@context': as2.CONTEXT,
             'type': 'Announce',
@@ -1267,10 +1279,15 @@ class WebTest(TestCase):
             self.req('https://www.user.com/post'),
         ))
 
-        inboxes = ('https://inbox', 'https://public/inbox', 'https://shared/inbox')
-        create_as2 = copy.deepcopy(CREATE_AS2)
-        create_as2['id'] = 'http://localhost/r/https://www.user.com/post#bridgy-fed-create'
-        create_as2['object']['id'] = 'http://localhost/r/https://www.user.com/post'
+        inboxes = FOLLOWER_INBOXES
+        create_as2 = {
+            **CREATE_AS2,
+            'id': 'http://localhost/r/https://www.user.com/post#bridgy-fed-create',
+            'object': {
+                **CREATE_AS2['object'],
+                'id': 'http://localhost/r/https://www.user.com/post',
+            },
+        }
         self.assert_ap_deliveries(mock_post, inboxes, create_as2)
 
     def test_create_post(self, mock_get, mock_post):
@@ -1287,7 +1304,7 @@ class WebTest(TestCase):
         mock_get.assert_has_calls((
             self.req('https://user.com/post'),
         ))
-        inboxes = ('https://inbox', 'https://public/inbox', 'https://shared/inbox')
+        inboxes = FOLLOWER_INBOXES
         self.assert_ap_deliveries(mock_post, inboxes, CREATE_AS2)
 
         self.assert_object('https://user.com/post',
@@ -1302,8 +1319,13 @@ class WebTest(TestCase):
         mock_get.return_value = NOTE
         mock_post.return_value = requests_response('abc xyz')
 
-        mf2 = copy.deepcopy(NOTE_MF2)
-        mf2['properties']['content'] = ['different']
+        mf2 = {
+            **NOTE_MF2,
+            'properties': {
+                **NOTE_MF2['properties'],
+                'content': ['different'],
+            },
+        }
         Object(id='https://user.com/post', users=[self.user.key], mf2=mf2).put()
 
         self.make_followers()
@@ -1317,7 +1339,7 @@ class WebTest(TestCase):
         mock_get.assert_has_calls((
             self.req('https://user.com/post'),
         ))
-        inboxes = ('https://inbox', 'https://public/inbox', 'https://shared/inbox')
+        inboxes = FOLLOWER_INBOXES
         self.assert_ap_deliveries(mock_post, inboxes, UPDATE_AS2)
         self.assert_object(
             'https://user.com/post',
@@ -1352,11 +1374,14 @@ class WebTest(TestCase):
         self.assertEqual(202, got.status_code)
 
         self.assertEqual(('https://inbox',), mock_post.call_args[0])
-        create = copy.deepcopy(CREATE_AS2)
-        create['object'].update({
-            'image': {'url': 'http://im/age', 'type': 'Image'},
-            'attachment': [{'url': 'http://im/age', 'type': 'Image'}],
-        })
+        create = {
+            **CREATE_AS2,
+            'object': {
+                **CREATE_AS2['object'],
+                'image': {'url': 'http://im/age', 'type': 'Image'},
+                'attachment': [{'url': 'http://im/age', 'type': 'Image'}],
+            },
+        }
         self.assert_equals(create, json_loads(mock_post.call_args[1]['data']))
 
     def test_follow(self, mock_get, mock_post):
@@ -1589,7 +1614,7 @@ class WebTest(TestCase):
         })
         self.assertEqual(202, got.status_code, got.text)
 
-        inboxes = ('https://inbox', 'https://public/inbox', 'https://shared/inbox')
+        inboxes = FOLLOWER_INBOXES
         self.assert_ap_deliveries(mock_post, inboxes, DELETE_AS2)
         self.assertTrue(Object.get_by_id('https://user.com/post').deleted)
 
@@ -2491,17 +2516,23 @@ class WebTest(TestCase):
         got = self.user.verify()
         self.assertEqual(self.user.key, got.key)
 
-        with self.subTest(redirects=redirects, hcard=hcard, actor=actor,
-                          redirects_error=redirects_error):
-            self.assert_equals(redirects, self.user.has_redirects)
-            self.assert_equals(hcard, self.user.has_hcard)
-            if actor is None:
-                assert not self.user.obj or not self.user.obj.as1
-            else:
-                got = {k: v for k, v in self.user.obj.as1.items()
-                       if k in actor}
-                self.assert_equals(actor, got)
-            self.assert_equals(redirects_error, self.user.redirects_error)
+        got_actor = None
+        if self.user.obj and self.user.obj.as1:
+            got_actor = self.user.obj.as1
+            if actor is not None:
+                got_actor = {k: v for k, v in got_actor.items() if k in actor}
+
+        self.assert_equals({
+            'redirects': redirects,
+            'hcard': hcard,
+            'actor': actor,
+            'redirects_error': redirects_error,
+        }, {
+            'redirects': self.user.has_redirects,
+            'hcard': self.user.has_hcard,
+            'actor': got_actor,
+            'redirects_error': self.user.redirects_error,
+        })
 
     def test_verify_neither(self, mock_get, _):
         empty = requests_response('')
@@ -3327,12 +3358,15 @@ class WebUtilTest(TestCase):
         mock_get.assert_not_called()
         mock_post.assert_not_called()
 
+    def _like_obj(self, source_protocol='ui'):
+        return Object(id='http://mas.to/like#ok', as2=test_activitypub.LIKE,
+                      source_protocol=source_protocol)
+
     def test_send_like(self, mock_get, mock_post):
         mock_get.return_value = WEBMENTION_REL_LINK
         mock_post.return_value = requests_response()
 
-        obj = Object(id='http://mas.to/like#ok', as2=test_activitypub.LIKE,
-                     source_protocol='ui')
+        obj = self._like_obj()
         self.assertTrue(Web.send(obj, 'https://user.com/post'))
 
         self.assert_req(mock_get, 'https://user.com/post')
@@ -3343,10 +3377,19 @@ class WebUtilTest(TestCase):
             'target': 'https://user.com/post',
         }, kwargs['data'])
 
+    def test_send_same_webmention_twice(self, mock_get, mock_post):
+        mock_get.return_value = WEBMENTION_REL_LINK
+        mock_post.return_value = requests_response()
+
+        obj = self._like_obj()
+        self.assertTrue(Web.send(obj, 'https://user.com/post'))
+        self.assertTrue(Web.send(obj, 'https://user.com/post'))
+
+        self.assertEqual(1, mock_post.call_count)
+
     def test_send_no_endpoint(self, mock_get, mock_post):
         mock_get.return_value = WEBMENTION_NO_REL_LINK
-        obj = Object(id='http://mas.to/like#ok', as2=test_activitypub.LIKE,
-                     source_protocol='activitypub')
+        obj = self._like_obj(source_protocol='activitypub')
 
         self.assertFalse(Web.send(obj, 'https://user.com/post'))
 
@@ -3372,33 +3415,53 @@ class WebUtilTest(TestCase):
         mock_get.assert_not_called()
         mock_post.assert_not_called()
 
-    def test_send_errors(self, mock_get, mock_post):
-        for err in [
-                requests.HTTPError(response=util.Struct(status_code='429', text='')),
-                requests.ConnectionError(),
-        ]:
-            with self.subTest(err=err):
-                mock_get.return_value = WEBMENTION_REL_LINK
-                mock_post.side_effect = err
-
-                obj = Object(id='http://mas.to/like#ok', as2=test_activitypub.LIKE,
-                             source_protocol='ui')
-                with self.assertRaises(err.__class__):
-                    Web.send(obj, 'https://user.com/post')
-
-                self.assert_req(mock_get, 'https://user.com/post')
-                args, kwargs = mock_post.call_args
-                self.assertEqual(('https://user.com/webmention',), args)
-                self.assertEqual({
-                    'source': 'https://fed.brid.gy/convert/web/http://mas.to/like%23ok',
-                    'target': 'https://user.com/post',
-                }, kwargs['data'])
+    def test_send_error_http(self, mock_get, mock_post):
+        self._test_send_error(
+            requests.HTTPError(response=util.Struct(status_code='429', text='')),
+            mock_get, mock_post)
+
+    def test_send_error_connection(self, mock_get, mock_post):
+        self._test_send_error(requests.ConnectionError(), mock_get, mock_post)
+
+    def _test_send_error(self, err, mock_get, mock_post):
+        mock_get.return_value = WEBMENTION_REL_LINK
+        mock_post.side_effect = err
+
+        obj = self._like_obj()
+        with self.assertRaises(err.__class__):
+            Web.send(obj, 'https://user.com/post')
+
+        self.assert_req(mock_get, 'https://user.com/post')
+        args, kwargs = mock_post.call_args
+        self.assertEqual(('https://user.com/webmention',), args)
+        self.assertEqual({
+            'source': 'https://fed.brid.gy/convert/web/http://mas.to/like%23ok',
+            'target': 'https://user.com/post',
+        }, kwargs['data'])
+
+    def test_send_rate_limited_skips_host(self, mock_get, mock_post):
+        mock_get.return_value = WEBMENTION_REL_LINK
+        mock_post.side_effect = requests.HTTPError(
+            response=util.Struct(status_code='429', text=''))
+
+        obj = self._like_obj()
+        with self.assertRaises(requests.HTTPError):
+            Web.send(obj, 'https://user.com/post')
+
+        mock_get.reset_mock()
+        mock_post.reset_mock()
+        with self.assertRaises(requests.HTTPError) as e:
+            Web.send(obj, 'https://user.com/post')
+
+        self.assertEqual(429, e.exception.response.status_code)
+        mock_get.assert_not_called()
+        mock_post.assert_not_called()
 
     def test_convert(self, mock_get, __):
         mock_get.return_value = ACTOR_HTML_RESP
 
         obj = Object(id='http://orig', mf2=ACTOR_MF2, source_protocol='web')
-        self.assert_multiline_equals("""\
+        self.assert_html_equals("""\
 <!DOCTYPE html>
 <html>
 <head><meta charset="utf-8">
@@ -3410,7 +3473,7 @@ class WebUtilTest(TestCase):
   </span>
 </body>
 </html>
-""", Web.convert(obj, from_user=None), ignore_blanks=True)
+""", Web.convert(obj, from_user=None))
 
     def test_convert_translates_ids(self, *_):
         self.store_object(id='http://fed/post', source_protocol='activitypub')
@@ -3441,6 +3504,26 @@ class WebUtilTest(TestCase):
 <a class="u-in-reply-to" href="https://ap.brid.gy/convert/web/http://fed/post"></a>
 </article>""", Web.convert(obj, from_user=None), ignore_blanks=True)
 
+    def test_convert_loads_same_author_and_actor_once(self, *_):
+        self.store_object(id='fake:alice', source_protocol='fake', our_as1={
+            'objectType': 'person',
+            'id': 'fake:alice',
+            'displayName': 'Ms. Alice',
+        })
+        obj = Object(id='fake:like', source_protocol='fake', our_as1={
+            'objectType': 'activity',
+            'verb': 'like',
+            'id': 'fake:like',
+            'actor': 'fake:alice',
+            'author': 'fake:alice',
+            'object': 'fake:post',
+        })
+
+        with patch.object(Fake, 'load', wraps=Fake.load) as mock_load:
+            self.assertIn('Ms. Alice', Web.convert(obj, from_user=None))
+
+        mock_load.assert_called_once_with('fake:alice', raise_=False)
+
     def test_convert_mention_web_user_translate_domain_id_to_homepage_url(self, *_):
         obj = self.store_object(id='fake:mention', source_protocol='fake', our_as1={
             'objectType': 'note',
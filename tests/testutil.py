@@ -18,6 +18,8 @@ from bs4 import MarkupResemblesLocatorWarning
 import dag_cbor.random
 from google.cloud import ndb
 from google.protobuf.timestamp_pb2 import Timestamp
+import lxml.etree
+import lxml.html
 from granary import as1, as2
 from granary.tests.test_as1 import (
     ACTOR,
@@ -652,16 +654,19 @@ class TestCase(unittest.TestCase, testutil.Asserts):
 
     def assert_ap_deliveries(self, mock_post, inboxes, data, from_user=None,
                              ignore=()):
-        self.assertEqual(len(inboxes), len(mock_post.call_args_list),
-                         mock_post.call_args_list)
+        self.assertCountEqual(inboxes,
+                              [args[0] for args, _ in mock_post.call_args_list])
 
+        expected_pem = (from_user or self.user).private_pem()
+        pems = {}  # maps id(RSA key) to exported PEM, keys are usually shared
         calls = {}  # maps inbox URL to JSON data
         for args, kwargs in mock_post.call_args_list:
             self.assertEqual(as2.CONTENT_TYPE_LD_PROFILE,
                              kwargs['headers']['Content-Type'])
             rsa_key = kwargs['auth'].header_signer._rsa._key
-            self.assertEqual((from_user or self.user).private_pem(),
-                             rsa_key.exportKey())
+            if id(rsa_key) not in pems:
+                pems[id(rsa_key)] = rsa_key.exportKey()
+            self.assertEqual(expected_pem, pems[id(rsa_key)])
             calls[args[0]] = json_loads(kwargs['data'])
 
         for inbox in inboxes:
@@ -687,6 +692,22 @@ class TestCase(unittest.TestCase, testutil.Asserts):
         return super().assert_equals(
             expected, actual, msg=msg, ignore=tuple(ignore) + ('@context',), **kwargs)
 
+    def assert_html_equals(self, expected, actual):
+        """Compares two HTML documents after canonicalizing them.
+
+        Ignores whitespace-only text, attribute order, and the doctype.
+        """
+        def canonicalize(html):
+            root = lxml.html.document_fromstring(html)
+            for elem in root.iter():
+                if elem.text and not elem.text.strip():
+                    elem.text = None
+                if elem.tail and not elem.tail.strip():
+                    elem.tail = None
+            return lxml.etree.tostring(root, method='c14n').decode()
+
+        self.assertEqual(canonicalize(expected), canonicalize(actual))
+
     @contextlib.contextmanager
     def assertLogs(self):
         """Wraps :meth:`unittest.TestCase.assertLogs` and enables/disables logs.
@@ -1,34 +1,30 @@
 """Webmention protocol with microformats2 in HTML, aka the IndieWeb stack."""
 from datetime import timedelta, timezone
 import difflib
+import hashlib
 import logging
-import re
 import statistics
 import urllib.parse
-from urllib.parse import quote, urlencode, urljoin, urlparse
+from urllib.parse import quote, urljoin, urlparse
 from xml.etree import ElementTree
 
 import brevity
 from flask import redirect, render_template, request
 from google.cloud import ndb
-from google.cloud.ndb import ComputedProperty
-from granary import as1, as2, atom, microformats2, rss
+from granary import as1, atom, microformats2, rss
 import mf2util
 from oauth_dropins.webutil import flask_util, util
-from oauth_dropins.webutil.appengine_config import tasks_client
 from oauth_dropins.webutil import appengine_info
 from oauth_dropins.webutil.flask_util import cloud_tasks_only, error, flash
 from oauth_dropins.webutil.util import domain_from_link, json_dumps, json_loads
 from oauth_dropins.webutil import webmention
-from requests import HTTPError, RequestException
-from requests.auth import HTTPBasicAuth
-from werkzeug.exceptions import BadGateway, BadRequest, HTTPException, NotFound
+from requests import HTTPError, RequestException, Response
+from werkzeug.exceptions import BadRequest, HTTPException
 
 import common
 from common import (
     CACHE_CONTROL,
-    DOMAIN_RE,
-    DOMAINS,
+    DOMAIN_PATTERN,
     PRIMARY_DOMAIN,
     PROTOCOL_DOMAINS,
     SUPERDOMAIN,
@@ -36,7 +32,7 @@ from common import (
 from flask_app import app
 from ids import normalize_user_id, translate_object_id, translate_user_id
 import memcache
-from models import Follower, Object, PROTOCOLS, Target, User
+from models import Object, PROTOCOLS, User
 from protocol import Protocol
 
 logger = logging.getLogger(__name__)
@@ -56,10 +52,17 @@ FEED_TYPES = {
 MIN_FEED_POLL_PERIOD = timedelta(hours=2)
 MAX_FEED_POLL_PERIOD = timedelta(days=1)
 MAX_FEED_ITEMS_PER_POLL = 10
+# how long to remember that we sent a given webmention, to skip duplicates
+WEBMENTION_SENT_EXPIRE = timedelta(minutes=5)
+# how long to stop sending webmentions to a host after it returns HTTP 429
+WEBMENTION_RATE_LIMITED_EXPIRE = timedelta(minutes=1)
 
 # populated into Web.redirects_error
 OWNS_WEBFINGER = 'This site serves its own Webfinger, and likely ActivityPub too.'
 
+# brevity.TLDS is a list of ~1500 TLDs
+TLDS = frozenset(brevity.TLDS)
+
 # in addition to common.DOMAIN_BLOCKLIST
 FETCH_BLOCKLIST = (
     'bsky.app',
@@ -76,17 +79,18 @@ def is_valid_domain(domain, allow_internal=True):
 
     Valid means TLD is ok, not blacklisted, etc.
     """
-    if not domain or not re.match(DOMAIN_RE, domain):
+    if not domain or not DOMAIN_PATTERN.match(domain):
         # logger.debug(f"{domain} doesn't look like a domain")
         return False
 
-    if Web.is_blocklisted(domain, allow_internal=allow_internal):
-        # logger.debug(f'{domain} is blocklisted')
+    # check TLD before blocklist since it's a single set lookup
+    tld = domain.rsplit('.', 1)[-1]
+    if tld not in TLDS:
+        # logger.info(f"{domain} looks like a domain but {tld} isn't a TLD")
         return False
 
-    tld = domain.split('.')[-1]
-    if tld not in brevity.TLDS:
-        # logger.info(f"{domain} looks like a domain but {tld} isn't a TLD")
+    if Web.is_blocklisted(domain, allow_internal=allow_internal):
+        # logger.debug(f'{domain} is blocklisted')
         return False
 
     return True
@@ -257,9 +261,10 @@ class Web(User, Protocol):
         """
         id = self.key.id()
 
-        if self.obj and self.obj.as1:
-            for url in (util.get_list(self.obj.as1, 'url') +
-                        util.get_list(self.obj.as1, 'urls')):
+        actor_as1 = self.obj.as1 if self.obj else None
+        if actor_as1:
+            for url in (util.get_list(actor_as1, 'url') +
+                        util.get_list(actor_as1, 'urls')):
                 url = url.get('value') if isinstance(url, dict) else url
                 if url and url.startswith('acct:'):
                     try:
@@ -477,6 +482,11 @@ class Web(User, Protocol):
         Returns False if the target URL doesn't advertise a webmention endpoint,
         or if webmention/microformats2 don't support the activity type.
         https://fed.brid.gy/docs#error-handling
+
+        Raises :class:`requests.HTTPError` with status 429 if the target's host
+        returned HTTP 429 within the last
+        :const:`WEBMENTION_RATE_LIMITED_EXPIRE`, so that the send task gets
+        retried later instead of dropped.
         """
         targets = as1.targets(obj.as1)
         if not (url in targets or
@@ -498,17 +508,41 @@ class Web(User, Protocol):
         # we only send webmentions for responses. for sending normal posts etc
         # to followers, we just update our stored objects (elsewhere) and web
         # users consume them via feeds.
-        endpoint = webmention_discover(url).endpoint
-        if not endpoint:
-            return False
+        sent_key = webmention_sent_memcache_key(source_url, url)
+        if memcache.memcache.get(sent_key):
+            logger.info(f'Already sent webmention from {source_url} to {url} recently, skipping')
+            return True
+
+        rate_limited_key = webmention_rate_limited_memcache_key(url)
+        if memcache.memcache.get(rate_limited_key):
+            msg = f'{urlparse(url).netloc} rate limited us recently, try again later'
+            logger.info(msg)
+            resp = Response()
+            resp.status_code = 429
+            resp.url = url
+            raise HTTPError(msg, response=resp)
+
+        try:
+            endpoint = webmention_discover(url).endpoint
+            if not endpoint:
+                return False
+            webmention.send(endpoint, source_url, url)
+        except BaseException as e:
+            code, _ = util.interpret_http_exception(e)
+            if code == '429':
+                memcache.memcache.set(
+                    rate_limited_key, 'rate-limited',
+                    expire=int(WEBMENTION_RATE_LIMITED_EXPIRE.total_seconds()))
+            raise
 
-        webmention.send(endpoint, source_url, url)
+        memcache.memcache.set(sent_key, 'sent',
+                              expire=int(WEBMENTION_SENT_EXPIRE.total_seconds()))
         return True
 
     @classmethod
     def load(cls, id, **kwargs):
         """Wrap :meth:`Protocol.load` to convert domains to homepage URLs."""
-        if re.match(DOMAIN_RE, id):
+        if DOMAIN_PATTERN.match(id):
             id = f'https://{id}/'
 
         return super().load(id, **kwargs)
@@ -670,11 +704,16 @@ class Web(User, Protocol):
 
         from_proto = PROTOCOLS.get(obj.source_protocol)
         if from_proto:
-            # fill in author/actor if available
+            # fill in author/actor if available. they're often the same, so
+            # only load each id once
+            loaded_by_id = {}
             for field in 'author', 'actor':
                 val = as1.get_object(obj_as1, field)
                 if val.keys() == set(['id']) and val['id']:
-                    loaded = from_proto.load(val['id'], raise_=False)
+                    if val['id'] not in loaded_by_id:
+                        loaded_by_id[val['id']] = from_proto.load(val['id'],
+                                                                  raise_=False)
+                    loaded = loaded_by_id[val['id']]
                     if loaded and loaded.as1:
                         obj_as1 = {**obj_as1, field: loaded.as1}
         else:
@@ -829,7 +868,8 @@ def poll_feed(user, feed_url, rel_type):
             if url := elem.get('url'):
                 elem['id'] = elem['url']
 
-        logger.debug(f'Converted to AS1: {json_dumps(activity, indent=2)}')
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f'Converted to AS1: {json_dumps(activity, indent=2)}')
 
         id = Object(our_as1=activity).as1.get('id')
         if not id:
@@ -1039,6 +1079,36 @@ def webmention_endpoint_cache_key(url):
     return key
 
 
+def webmention_sent_memcache_key(source, target):
+    """Returns the memcache key for a webmention we've recently sent.
+
+    Hashes the source and target URLs so that long URLs don't get truncated
+    by :func:`memcache.key` and collide.
+
+    Args:
+      source (str): URL
+      target (str): URL
+
+    Returns:
+      bytes:
+    """
+    digest = hashlib.blake2b(f'{source} {target}'.encode(),
+                             digest_size=16).hexdigest()
+    return memcache.key(f'webmention-sent-{digest}')
+
+
+def webmention_rate_limited_memcache_key(url):
+    """Returns the memcache key for a host that recently rate limited us.
+
+    Args:
+      url (str): webmention target URL
+
+    Returns:
+      bytes:
+    """
+    return memcache.key(f'webmention-rate-limited-{urlparse(url).netloc}')
+
+
 @memcache.memoize(expire=timedelta(hours=2), key=webmention_endpoint_cache_key)
 def webmention_discover(url, **kwargs):
     """Thin caching wrapper around :func:`oauth_dropins.webutil.webmention.discover`."""